@@ -61,7 +61,8 @@ def dramatic_sleep(seconds):
 setbatching(1)
 
 screensize = [800,600]
-setmode((screensize[0],screensize[1]))
+WINDOW_SIZE = None # Default None. e.g. (1600,1200), or (0,0) for the whole desktop. The game is still drawn at screensize, then scaled up to fit
+setmode((screensize[0],screensize[1]), windowsize=WINDOW_SIZE)
 GRIDSIZE = [((screensize[0] - 40) // 20),((screensize[1] - 40) // 20)] #Width // 20, Height // 20 (Grid starts at 20,20, giving the screen a 20-width border)
 
 # This acts as a loading screen while we load any more content
@@ -71,6 +72,8 @@ tick()
 dramatic_sleep(1)
 printat(Pos(screensize[0]//2,100),"Avoid everyone, take everything",fg=Colour.red,pointsize=30,temp=1)
 tick()
+buildatlas(["Sprites/Floor","Sprites/Vims","Sprites/Player.bmp","Sprites/PlayerLose.bmp","Sprites/Enemy.bmp","Sprites/Book.png","Sprites/dot.png"])
+Vim.load_frames()
 dramatic_sleep(1)
 
 def sloppy_weighted_random_index(w_list):
@@ -121,37 +124,40 @@ def dungeonLine(ps, x0y0, x1y1, start_adjust=(0,0), target_adjust=(0,0)):
 			ps.add_tile_by_pos((x0 * 20, y0 * 20))
 			y0 = y0 + sy
 
-def lighting(character,ps):
+def create_layers(ps):
+	# Bottom to top. The floor and room overlay never change, so they are drawn once
+	addlayer("floor")
+	addlayer("lighting",blend=pygame.BLEND_RGB_SUB,fill=(255,255,255))
+	addlayer("debug")
+	addlayer("entities")
+	addlayer("hud")
+	setlayer("floor")
+	superblit(Pos(0,0),ps.floor_surface)
 	if ps.fullbright:
-		for pos in ps.list_tile_positions():
-			plotimage(pos,"Sprites/Floor/FloorTexture.bmp",temp=1)
-			#plotimage(Pos(pos[0]-1,pos[1]-1),"Sprites/Floor/FloorTexture21.bmp",temp=1)
+		showlayer("lighting",0)
+	if ps.view_hitboxes:
+		setlayer("debug")
+		plotimages([(pos,"Sprites/Floor/room.bmp") for pos in ps.list_room_positions()])
 
-	else:
-		for pos in ps.list_tile_positions():
-			x_diff = abs(pos[0] - (character.position[0]))
-			y_diff = abs(pos[1] - (character.position[1]))
-			if x_diff**2 + y_diff**2 <= 6400:
-				plotimage(pos,"Sprites/Floor/FloorTexture.bmp",temp=1)
-				#plotimage(Pos(pos[0]-1,pos[1]-1),"Sprites/Floor/FloorTexture21.bmp",temp=1)
-
-		if DYNAMIC_LIGHTING:
-			light = pygame.image.load("Sprites/lighting_test.png")
-			grey_surface = pygame.surface.Surface((screensize[0],screensize[1]))
-			grey_surface.fill(pygame.color.Color("lightgray"))
-			grey_surface.blit(light,character.position-Pos(65,65)) # This isn't top left, so it needs to be slightly off-center
-			screen = get_screen()
-			screen.blit(grey_surface, (0,0), special_flags=pygame.BLEND_RGBA_SUB)
-			pygame.display.flip()
+def lighting(character,ps):
+	if not ps.fullbright:
+		setlayer("lighting")
+		corner, lit_tiles = ps.lit_tiles(character.position)
+		light_source.add_light(character.position + Pos(10,10), 75, 0.92) # Positions are top left, so this is the centre of the sprite
+		for vim in ps.vims:
+			glow = vim.glow()
+			if glow:
+				light_source.add_light(vim.position + Pos(10,10), *glow)
+		light_source.draw(corner,lit_tiles)
 	
 	if ps.view_hitboxes:
+		setlayer("debug")
 		for pos in ps.list_wall_positions():
 			#plotimage(pos,"Sprites/wall.png")
 			continue
-		for pos in protag.bounding_box:
-			plotimage(pos-Pos(1,1),"Sprites/dot.png",temp=1)
-		for pos in ps.list_room_positions():
-			plotimage(pos,"Sprites/Floor/room.bmp")
+		hitbox = protag.hitbox_overlay()
+		if hitbox:
+			superblit(hitbox[0],hitbox[1],temp=1)
 
 def direction_key(direction,dvorak):
 	if direction == "FORWARD":
@@ -166,7 +172,9 @@ def direction_key(direction,dvorak):
 def rungame(play_space):
 	timer = 0
 	ticks = 20
+	f3_was_down = False
 	while protag.health > 0:
+		profiler.begin("input")
 		if direction_key("FORWARD", DVORAK):
 			protag.move(FORWARD,play_space)
 		elif direction_key("BACKWARD", DVORAK):
@@ -191,7 +199,13 @@ def rungame(play_space):
 			if ispressed(K_p):
 				print(protag.position)
 				print(protag.bounding_box)
+			# Only toggle when F3 goes down, not on every frame it's held
+			f3_down = ispressed(K_F3)
+			if f3_down and not f3_was_down:
+				profiler.visible = not profiler.visible
+			f3_was_down = f3_down
 
+		profiler.begin("monster AI")
 		for monster in play_space.monsters:
 			augmented_protag_distance = (monster.position[0] - protag.position[0]) ** 2 + (monster.position[1] - protag.position[1]) ** 2 - play_space.monster_coefficient
 			# At 2 monsters (inital), "vision" is 60 pixels, and this goes up by 10 for every new pair of monsters
@@ -204,24 +218,42 @@ def rungame(play_space):
 		if all([not vim.exist for vim in play_space.vims]): # this should never occur in normal gameplay
 			play_space.create_vim()
 
+		profiler.begin("cleartemp")
 		cleartemp()
 
+		profiler.begin("lighting")
 		lighting(protag,play_space)
 		#plotimage(Pos(0,0),"Sprites/Player.bmp") # debug
-		plotimage(protag.position, "Sprites/Player.bmp", temp=1)
+		profiler.begin("entity draw")
+		# Everything that moves is collected and then drawn in one go
+		sprites = [(protag.position, "Sprites/Player.bmp")]
 
 		for monster in play_space.monsters:
 			if FULLBRIGHT:
-				plotimage(monster.position, "Sprites/Enemy.bmp", temp=1)
+				sprites.append((monster.position, "Sprites/Enemy.bmp"))
 			elif monster.position[0] in range(int(protag.position[0] - 90),int(protag.position[0] + 90)) and monster.position[1] in range(int(protag.position[1] - 90),int(protag.position[1] + 90)):
-				plotimage(monster.position, "Sprites/Enemy.bmp", temp=1)
+				sprites.append((monster.position, "Sprites/Enemy.bmp"))
 
+		profiler.begin("vim updates")
 		for vim in play_space.vims:
 			if vim.exist:
-				vim.animate(protag)
+				sprite = vim.animate(protag)
+				if sprite:
+					sprites.append(sprite)
 				vim.collide(protag,play_space,dramatic_sleep)
 
-		tick(ticks)
+		profiler.begin("entity draw")
+		setlayer("entities")
+		plotimages(sprites,temp=1)
+		if profiler.visible:
+			profiler.begin("overlay")
+			setlayer("hud")
+			profiler.draw()
+		profiler.begin("frame wait")
+		waitforframe(ticks)
+		profiler.begin("present")
+		tick()
+		profiler.end_frame()
 		timer += 1/ticks
 	return timer
 
@@ -287,11 +319,18 @@ play_space.create_vim(4)
 #play_space.create_monster()
 
 play_space.initialise_walls()
+play_space.bake_floor("Sprites/Floor/FloorTexture.bmp")
+# The darkness covers the whole lit floor, everything outside of that is blacked out by the lighting layer
+light_source = Lighting((2 * play_space.light_radius + 20, 2 * play_space.light_radius + 20), 211 if DYNAMIC_LIGHTING else 0)
+# Press F3 with the dev controls on to see how long each part of a frame takes
+profiler = FrameProfiler(["input","monster AI","vim updates","cleartemp","lighting","entity draw","frame wait","present"])
 
 printat(Pos(screensize[0]//2,screensize[1] - 100),"Press space to start",fg=Colour.red,pointsize=30,temp=1)
 tick()
 waitforkeys([K_SPACE])
+create_layers(play_space)
 timetaken = rungame(play_space)
+removelayers()
 
 printat((screensize[0] / 2,screensize[1] / 2), "Game over", fg=Colour.red, pointsize=30)
 tick()
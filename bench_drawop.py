@@ -0,0 +1,86 @@
+""" Times easygame's _drawop drawing a non-temporary shape twice, on the
+screen and the background, against drawing it once on the background and
+copying its rectangle to the screen, for the shapes and sizes below.
+
+Run it with ``python bench_drawop.py``. It uses SDL's dummy video driver,
+so no window appears. The figures are used to set easygame._drawonce.
+
+How long SDL takes to copy a rectangle depends a lot on where it is
+(blits starting at some x positions are many times slower than at their
+neighbours), so each shape is timed at eight positions a pixel apart and
+the times are averaged.
+"""
+import os, sys, time
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+import easygame
+from easygame import *
+
+BATCHES = 15
+CALLS = 50
+OFFSETS = range(8)
+
+def triangle(r):
+    return [(320,240-r), (320+r,240+r), (320-r,240+r//2)]
+
+def moved(args, dx):
+    """ return the arguments for a shape moved dx pixels to the right """
+    result = []
+    for arg in args:
+        if isinstance(arg, Rect):
+            arg = arg.move(dx, 0)
+        elif isinstance(arg, tuple) and len(arg) == 2 and arg[0] == 320:
+            arg = (arg[0] + dx, arg[1])
+        elif isinstance(arg, list):
+            arg = [(x + dx, y) for (x, y) in arg]
+        result.append(arg)
+    return tuple(result)
+
+def shapes():
+    """ yield (name, op, args) for each shape to time """
+    for r in (5, 20, 80, 200):
+        yield 'circle r=%d' % r, pygame.draw.circle, ((320,240), r, 0)
+        yield 'circle width 8 r=%d' % r, pygame.draw.circle, ((320,240), r, 8)
+        yield 'ellipse %dx%d' % (2*r, r), pygame.draw.ellipse, (Rect(320-r, 240-r//2, 2*r, r), 0)
+        yield 'polygon r=%d' % r, pygame.draw.polygon, (triangle(r), 0)
+        yield 'lines r=%d' % r, pygame.draw.lines, (1, triangle(r), 1)
+        yield 'lines width 8 r=%d' % r, pygame.draw.lines, (1, triangle(r), 8)
+        yield 'aalines r=%d' % r, pygame.draw.aalines, (1, triangle(r))
+
+def timeit(obj, op, args):
+    """ return the time of one call in microseconds, the median of the
+    batches averaged over the positions """
+    total = 0.0
+    for dx in OFFSETS:
+        shape = moved(args, dx)
+        times = []
+        for batch in range(BATCHES):
+            start = time.perf_counter()
+            for i in range(CALLS):
+                obj._drawop(op, *shape)
+            times.append((time.perf_counter() - start) / CALLS * 1e6)
+            obj.dirty.take()
+        times.sort()
+        total += times[len(times)//2]
+    return total / len(OFFSETS)
+
+def main():
+    setbatching(1)
+    obj = easygame._obj
+    col = Colour('red')
+    saved = dict(easygame._drawonce)
+    print('%-22s %8s %8s %8s' % ('shape', 'area', 'twice', 'once'))
+    try:
+        for (name, op, args) in shapes():
+            args = (col,) + args
+            easygame._drawonce.clear()
+            rect = obj._drawop(op, *args)
+            twice = timeit(obj, op, args)
+            easygame._drawonce[op] = sys.maxsize
+            once = timeit(obj, op, args)
+            print('%-22s %8d %8.1f %8.1f' % (name, rect.width*rect.height, twice, once))
+    finally:
+        easygame._drawonce.clear()
+        easygame._drawonce.update(saved)
+
+if __name__ == '__main__':
+    main()
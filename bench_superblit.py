@@ -0,0 +1,67 @@
+""" Times the per-call cost of easygame's superblit and plotimage for a
+20x20 image, through the fast path for whole, unrotated images and
+through the general path that every call took before it. Passing the
+image's whole rectangle as srcrect sends a call down the general path
+while drawing exactly the same pixels.
+
+Run it with ``python bench_superblit.py``. It uses SDL's dummy video
+driver, so no window appears.
+
+How long SDL takes to copy a rectangle depends a lot on where it is, so
+each case is timed at eight positions a pixel apart and the times are
+averaged.
+"""
+import os, sys, time
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+import easygame
+from easygame import *
+
+BATCHES = 40
+CALLS = 200
+OFFSETS = range(8)
+IMAGE = 'Sprites/Player.bmp'
+
+def cases(img):
+    """ yield (name, call) for each case, where call(dx, **kwargs) draws
+    once, dx pixels to the right """
+    yield 'superblit temp', lambda dx, **k: superblit((90+dx,90), img, temp=1, **k)
+    yield 'superblit', lambda dx, **k: superblit((90+dx,90), img, **k)
+    yield 'superblit centred, temp', lambda dx, **k: superblit((100+dx,100), img, temp=1, topleft=0, **k)
+    yield 'superblit partly off, temp', lambda dx, **k: superblit((-5-dx,100), img, temp=1, **k)
+    yield 'plotimage temp', lambda dx, **k: plotimage((90+dx,90), IMAGE, temp=1, **k)
+
+def timeit(obj, call, **kwargs):
+    """ return the time of one call in microseconds, the median of the
+    batches averaged over the positions """
+    total = 0.0
+    for dx in OFFSETS:
+        times = []
+        for batch in range(BATCHES):
+            start = time.perf_counter()
+            for i in range(CALLS):
+                call(dx, **kwargs)
+            times.append((time.perf_counter() - start) / CALLS * 1e6)
+            cleartemp()
+            obj.dirty.take()
+        times.sort()
+        total += times[len(times)//2]
+    return total / len(OFFSETS)
+
+def main():
+    setbatching(1)
+    obj = easygame._obj
+    img = pygame.Surface((20,20))
+    img.fill(Colour('red'))
+    plotimage((0,0), IMAGE, temp=1) # load it into the image cache
+    whole = img.get_rect()
+    print('%-28s %8s %8s' % ('case', 'general', 'fast'))
+    for (name, call) in cases(img):
+        general = timeit(obj, call, srcrect=whole)
+        fast = timeit(obj, call)
+        print('%-28s %8.2f %8.2f' % (name, general, fast))
+    screen = getscreensurface()
+    print('%-28s %17.2f' % ('raw Surface.blit', timeit(obj, lambda dx: screen.blit(img, (90+dx,90)))))
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,6 @@
 import random
+import time
+import numpy
 from easygame import *
 
 class PlaySpace:
@@ -23,6 +25,9 @@ class PlaySpace:
 		self.pages = pages
 		self.monster_coefficient = 0
 		self.monster_count = 0
+		self.light_radius = 80
+		self.light_stencils = {}
+		self.floor_surface = None
 
 		# Dev tools
 		self.fullbright = fullbright
@@ -73,6 +78,43 @@ class PlaySpace:
 						self.wall_hash[i][j] = new_wall
 						self.wall_set.add((i,j))
 
+	def bake_floor(self, texture):
+		'Render every floor tile into one surface. Call once the dungeon has been generated'
+		tile = plotimage(Pos(0,0), texture, onlygetsurface=1)
+		self.floor_surface = pygame.Surface(self.screen_size)
+		self.floor_surface.blits([(tile, tuple(self.grid_to_position[ij[0]][ij[1]])) for ij in self.tile_set], doreturn=0)
+		self.floor_surface.set_colorkey((0,0,0))
+
+	def light_stencil(self, offset):
+		'The grid offsets within the light radius of a position offset pixels into its grid square, each with the rect of that tile relative to the lit area'
+		stencil = self.light_stencils.get(offset)
+		if stencil is None:
+			r = self.light_radius
+			ox, oy = offset
+			reach = r // 20 + 1
+			stencil = []
+			for di in range(-reach, reach + 1):
+				for dj in range(-reach, reach + 1):
+					if (20 * di - ox)**2 + (20 * dj - oy)**2 <= r * r:
+						stencil.append((di, dj, pygame.Rect(20 * di - int(ox) + r, 20 * dj - int(oy) + r, 20, 20)))
+			# The player moves a pixel at a time, so there are only ever a few hundred of these
+			self.light_stencils[offset] = stencil
+		return stencil
+
+	def lit_tiles(self, pos):
+		'Find the floor tiles within the light radius of pos. Returns the top left corner of the lit area and the tiles as rects relative to it'
+		r = self.light_radius
+		corner = (int(pos[0]) - r, int(pos[1]) - r)
+		gx, gy = self.pos_to_grid(pos)
+		tile = (20 * gx + 20, 20 * gy + 20)
+		tiles = []
+		for di, dj, rect in self.light_stencil((pos[0] - tile[0], pos[1] - tile[1])):
+			i = gx + di
+			j = gy + dj
+			if 0 <= i < self.grid_size[0] and 0 <= j < self.grid_size[1] and self.tile_hash[i][j]:
+				tiles.append(rect)
+		return corner, tiles
+
 	def create_room_from_grid(self,pos,width,height):
 		'Creates a room with top left grid co-ordinate pos that extends right width-many and down height-many tiles'
 		width = min(width, self.grid_size[0] - pos[0] + 1)
@@ -83,6 +125,107 @@ class PlaySpace:
 				self.room_hash[pos[0] + i][pos[1] + j] = True
 		self.rooms.append((pos,width,height))
 
+class Lighting:
+	'Draws the shade for a layer that is subtracted from the floor. Only lit tiles let the floor through, darkened by shade except where the lights added this frame reach'
+
+	def __init__(self, size, shade=211):
+		self.size = size
+		self.shade = shade
+		self.masks = {}
+		self.lights = []
+		self.window = pygame.Surface(size, 0, 32)
+
+	def mask(self, radius):
+		'The falloff of a light of the given radius, from 1 at the centre down to 0 at the radius'
+		mask = self.masks.get(radius)
+		if mask is None:
+			d = numpy.arange(-radius, radius + 1, dtype=numpy.float32)
+			mask = numpy.clip(1 - numpy.hypot(d[:,None], d[None,:]) / radius, 0, 1)
+			self.masks[radius] = mask
+		return mask
+
+	def add_light(self, centre, radius, brightness=1):
+		'Light up to radius around centre for the next draw'
+		self.lights.append((int(centre[0]), int(centre[1]), radius, brightness))
+
+	def draw(self, corner, lit_rects):
+		'Draw the shade with its top left at corner, then forget the lights. Outside of lit_rects everything is blacked out'
+		w, h = self.size
+		# All the lights are added up in one array, indexed [x][y] like surfarray
+		light = numpy.zeros((w, h), numpy.float32)
+		for x, y, radius, brightness in self.lights:
+			mask = self.mask(radius)
+			x -= corner[0] + radius
+			y -= corner[1] + radius
+			x0, y0 = max(x, 0), max(y, 0)
+			x1, y1 = min(x + 2 * radius + 1, w), min(y + 2 * radius + 1, h)
+			if x0 < x1 and y0 < y1:
+				light[x0:x1,y0:y1] += brightness * mask[x0-x:x1-x,y0-y:y1-y]
+		self.lights = []
+		darkness = (self.shade * (1 - numpy.minimum(light, 1))).astype(numpy.uint8)
+		shade = numpy.full((w, h), 255, numpy.uint8)
+		for rect in lit_rects:
+			shade[rect.left:rect.right,rect.top:rect.bottom] = darkness[rect.left:rect.right,rect.top:rect.bottom]
+		pixels = pygame.surfarray.pixels3d(self.window)
+		pixels[...] = shade[:,:,None]
+		del pixels # Unlocks the window
+		return superblit(corner, self.window, temp=1)
+
+class FrameProfiler:
+	'Times the named stages of each frame, keeping the last few hundred frames of each stage in a ring buffer'
+
+	def __init__(self, stages, frames=256):
+		self.frames = frames
+		self.stages = []
+		self.times = {}
+		for name in stages:
+			self.add_stage(name)
+		self.index = 0
+		self.count = 0
+		self.current = None
+		self.started = None
+		self.visible = False
+
+	def add_stage(self, name):
+		self.stages.append(name)
+		self.times[name] = [0.0] * self.frames
+
+	def begin(self, name):
+		'End the current stage and start timing name. A stage can be begun more than once a frame, and the times add up'
+		now = time.perf_counter()
+		if self.current is not None:
+			self.times[self.current][self.index] += now - self.started
+		if name not in self.times:
+			self.add_stage(name)
+		self.current = name
+		self.started = now
+
+	def end_frame(self):
+		'End the current stage and move on to the next frame, overwriting the oldest one'
+		if self.current is not None:
+			self.times[self.current][self.index] += time.perf_counter() - self.started
+		self.current = None
+		self.index = (self.index + 1) % self.frames
+		# The slot at index is the frame in progress, so it isn't counted
+		self.count = min(self.count + 1, self.frames - 1)
+		for name in self.stages:
+			self.times[name][self.index] = 0.0
+
+	def stats(self):
+		'The median, 95th percentile and maximum time of each stage in milliseconds, over the frames recorded so far'
+		stats = {}
+		for name in self.stages:
+			times = sorted(self.times[name][(self.index - k) % self.frames] for k in range(1, self.count + 1)) or [0.0]
+			stats[name] = (1000 * times[len(times) // 2], 1000 * times[min(len(times) - 1, len(times) * 95 // 100)], 1000 * times[-1])
+		return stats
+
+	def draw(self, pos=Pos(25,25)):
+		'Show the stats as temporary drawing with pos at the top left'
+		printat(pos, "stage  p50  p95  max (ms)", fg=Colour.white, pointsize=12, topleft=1, temp=1)
+		stats = self.stats()
+		for n, name in enumerate(self.stages):
+			printat(pos + Pos(0, 14 * (n + 1)), "%s  %.2f  %.2f  %.2f" % ((name,) + stats[name]), fg=Colour.white, pointsize=12, topleft=1, temp=1)
+
 class GamePiece:
 	def __init__(self, position, shape):
 		self.shape = shape
@@ -131,18 +274,38 @@ class GamePiece:
 						and self.position[1] in range(int(other.position[1]-19),int(other.position[1]+19)))
 
 class MobileObject(GamePiece):
+	# The hitbox overlay only depends on the shape, so it is drawn once for each
+	hitbox_overlays = {}
+
 	def __init__(self, position, shape, speed=1, noclip=False):
 		super().__init__(position, shape)
 		self.speed = speed
 		self.noclip = noclip
 		self.bounding_box = None
+		self.bounding_box_position = None
 		self.create_bounding_box()
 
 	def create_bounding_box(self):
 		if self.shape == "circle":
 			self.bounding_box = [(self.position[0] + i, self.position[1] + j) for i in range(20) for j in range(20) if (i + j >= 5) and (j - i <= 14) and (i - j <= 13) and (i + j <= 32)]
+			self.bounding_box_position = self.position
 		else:
 			self.bounding_box = None
+			self.bounding_box_position = None
+
+	def hitbox_overlay(self):
+		'A dot on every point of the bounding box, as a surface and the position to draw it at. Returns None if there is no bounding box'
+		if self.bounding_box is None:
+			return None
+		overlay = self.hitbox_overlays.get(self.shape)
+		if overlay is None:
+			dot = plotimage(Pos(0,0),"Sprites/dot.png",onlygetsurface=1)
+			# Dots are drawn one pixel up and left of their point
+			overlay = pygame.Surface((22,22), pygame.SRCALPHA, 32)
+			x, y = self.bounding_box_position
+			overlay.blits([(dot, (int(pos[0] - x), int(pos[1] - y))) for pos in self.bounding_box], doreturn=0)
+			self.hitbox_overlays[self.shape] = overlay
+		return self.bounding_box_position - Pos(1,1), overlay
 	
 	def move(self,direction,ps,debug=False):
 		newpos = self.position + direction * self.speed
@@ -254,6 +417,16 @@ class Enemy(MobileObject):
 			#		protag.health = 0
 
 class Vim(GamePiece):
+	# Shared by every vim, filled in by load_frames
+	eye_frames = None
+	book_frame = None
+
+	@classmethod
+	def load_frames(cls):
+		'Load the sprites for every vim. Call once, after the atlas has been built'
+		# animation_frame // 4 runs from -1 (closed) to 6 (wide open)
+		cls.eye_frames = loadanimation(["Sprites/Vims/Vim" + str(i) + ".png" for i in range(-1, 7)])
+		cls.book_frame = loadanimation(["Sprites/Book.png"])[0]
 
 	def __init__(self,ps,book_probability=100):
 		super().__init__((-20,-20),"circle")
@@ -278,17 +451,29 @@ class Vim(GamePiece):
 				grid_position = random.choice(tuple(tile_set))
 				self.position = ps.grid_to_position[grid_position[0]][grid_position[1]]
 
+	def glow(self):
+		'The light the vim gives off as (radius, brightness), or None if it is dark'
+		if not self.exist:
+			return None
+		if self.book:
+			return (40, 0.5)
+		if self.animation_frame <= 0:
+			return None
+		return (30, 0.5 * self.animation_frame / 26) # Brighter the wider the eye is open
+
 	def animate(self,protag):
+		'Advance the animation and return the (position, sprite) to draw, or None if there is nothing to draw'
 		if self.exist:
 			if self.book:
 				if (self.position[0] - protag.position[0]) ** 2 + (self.position[1] - protag.position[1]) ** 2 < 6400:
-					plotimage(self.position, "Sprites/Book.png", temp=1)
+					return (self.position, self.book_frame)
 			else:
 				if (self.position[0] - protag.position[0]) ** 2 + (self.position[1] - protag.position[1]) ** 2 > 8100:
 					self.animation_frame = max(-4, self.animation_frame - 1)
 				else:
 					self.animation_frame = min(26, self.animation_frame + 2) # The eye opening is faster
-				plotimage(self.position, "Sprites/Vims/Vim" + str(self.animation_frame // 4) + ".png",temp=1)
+				return (self.position, self.eye_frames[self.animation_frame // 4 + 1])
+		return None
 
 	def collide(self,protag,ps,dramatic_sleep):
 		if self.exist:
@@ -297,13 +482,16 @@ class Vim(GamePiece):
 				ps.create_monster(2)
 				ps.create_vim()
 				if self.book:
-					clearscreen()
+					# The page covers everything else, so it goes on the top layer
+					setlayer("hud")
+					rectangle(((0,0),ps.screen_size),col=Colour.black,temp=1)
 					tick()
 					#print(pages)
 					printat(Pos(ps.screen_size[0]//2,ps.screen_size[1]//2),random.choice(ps.pages).replace("\n",""),fg = Colour.red, pointsize = 30,temp=1)
 					tick()
 					dramatic_sleep(5)
 					cleartemp()
+					setlayer()
 					tick()
 				return True
 		return False
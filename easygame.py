@@ -124,6 +124,14 @@ it start. Can you guess what it will do before running it?::
 As an exercise, try predicting what commenting out any particular line
 would do to the program.
 
+Without setbatching(1), the screen is updated after every single
+drawing command, which gets slow once you draw a lot of things. If you
+would rather not call tick() yourself, ``setautobatching()`` makes
+easygame update the screen at most once every 16 milliseconds (about
+once per refresh of the display) instead. Anything not yet shown
+appears when you next check the keyboard with ``ispressed()``,
+``getkey()`` or ``waitforkeys()``, or call ``pause()`` or ``tick()``.
+
 What we've got so far is actually enough for a lot of animation, but
 there's a problem. It is fiddly to get rid of things off the screen
 without clearing the whole screen and redrawing everything. If you've
@@ -473,6 +481,36 @@ background. There's no concept of a stacking order of temporary
 layers; what you draw goes on the screen in the order you draw it, and
 cleartemp() is just another way of drawing.
 
+Layers
+======
+
+Temporary drawing has no stacking order, but sometimes you want some
+things to always appear on top of others, or want to draw a
+complicated scene once and then animate things over it. ``addlayer()``
+creates named layers which are stacked in the order they are added,
+and ``setlayer()`` chooses which one the drawing commands draw on::
+
+    from easygame import *
+    setbatching(1)
+    addlayer('scenery')
+    addlayer('ball')
+    setlayer('scenery')
+    for x in range(0, 640, 40):
+        circle( (x,240), 20, col=(0,128,0) )  # drawn just once
+    setlayer('ball')
+    x = 0
+    while 1:
+        cleartemp()
+        circle( (x,240), 30, col=(255,0,0), temp=1)
+        x = (x + 1) % 640
+        tick(100)
+
+Each layer keeps its own picture, so the ball never rubs out the
+scenery. ``tick()`` puts the layers together, but only where something
+has changed. ``setlayer()`` with no arguments goes back to drawing on
+the normal screen, which is underneath all the layers, and
+``removelayers()`` gets rid of the layers altogether.
+
 ``Manipulating surfaces``
 
 It takes the system a little time to rotate and zoom on images and
@@ -506,6 +544,21 @@ APIs::
 
       tick(100)
 
+Running without a display
+=========================
+
+Easygame can also draw into an offscreen surface, with no window at
+all. This is handy for timing a game or running it on a computer with
+no screen. Set ``sys.easygameheadless`` before importing easygame::
+
+    import sys
+    sys.easygameheadless = 1
+    from easygame import *
+
+or set the environment variable ``EASYGAME_HEADLESS=1``. Everything
+works as normal, except that nothing is shown and there is no keyboard;
+use ``setkeysdown()`` to choose which keys ``ispressed()`` reports.
+
 
 A worked exercise- Pacman!
 ==========================
@@ -1475,6 +1528,39 @@ def clippoly(poslist, cr):
     return poslist
 
 
+def mergerects(rects, bounds, exact=0):
+    """ Clip rects to bounds and merge the ones that overlap or touch,
+    returning a new list of Rects.
+
+    Two rectangles are merged when their bounding box is no bigger than
+    the two of them together. If exact is set they are only merged when
+    the bounding box covers no pixels outside of them.
+
+    >>> mergerects([Rect(0,0,20,20), Rect(20,0,20,20), Rect(100,100,5,5)], Rect(0,0,640,480))
+    [<rect(0, 0, 40, 20)>, <rect(100, 100, 5, 5)>]
+    """
+    merged = []
+    for rect in rects:
+        rect = bounds.clip(rect)
+        if rect.width == 0 or rect.height == 0: continue
+        while True:
+            # inflating by one pixel each way finds adjacent rectangles too
+            for i in rect.inflate(2,2).collidelistall(merged):
+                other = merged[i]
+                union = rect.union(other)
+                limit = rect.width*rect.height + other.width*other.height
+                if exact:
+                    overlap = rect.clip(other)
+                    limit -= overlap.width*overlap.height
+                if union.width*union.height <= limit:
+                    del merged[i]
+                    rect = union
+                    break
+            else:
+                break
+        merged.append(rect)
+    return merged
+
 def rotozoompositions(positions,angle,zoom):
     cx,cy = 0, 0
     for pos in positions:
@@ -1666,7 +1752,268 @@ class Sprite:
         except:
             print('exc')
             pass
-            
+
+class _DirtyRegion:
+    """ Collects the rectangles touched since the last screen update and
+    merges them before they are passed to pygame.display.update.
+
+    Overlapping and adjacent rectangles are merged when their union is
+    no bigger than the two rectangles together, so a run of tiles becomes
+    a single rectangle. Once the merged area passes fullfraction of the
+    bounds the whole of the bounds is updated instead.
+
+    mergerects takes time roughly proportional to the square of the number
+    of rectangles, so above maxrects of them the grid squares of cellsize
+    pixels they touch are updated instead.
+    """
+    maxrects = 64
+    cellsize = 20
+    def __init__(self, bounds, fullfraction=0.5):
+        self.bounds = Rect(bounds)
+        self.fullfraction = fullfraction
+        self.rects = []
+        self.lastarea = 0
+    def add(self, rect):
+        self.rects.append(rect)
+    def addrects(self, rects):
+        self.rects.extend(rects)
+    def __len__(self):
+        return len(self.rects)
+    def merge(self):
+        """ return the merged, clipped list of touched rectangles """
+        if len(self.rects) > self.maxrects:
+            return self._gridmerge()
+        return mergerects(self.rects, self.bounds)
+    def _gridmerge(self):
+        """ merge the touched rectangles in time proportional to their
+        number. Each row of the grid is a bitmask of the squares touched;
+        runs of touched squares become rectangles, and runs that line up
+        in the rows below make those rectangles taller. """
+        bounds = self.bounds
+        cell = self.cellsize
+        (left, top) = bounds.topleft
+        rows = [0] * ((bounds.height + cell - 1) // cell)
+        for rect in [bounds.clip(rect) for rect in self.rects]:
+            if not rect: continue
+            (x, y, w, h) = rect
+            x -= left
+            y -= top
+            x0 = x // cell
+            bits = ((2 << ((x + w - 1) // cell - x0)) - 1) << x0
+            for row in range(y // cell, (y + h - 1) // cell + 1):
+                rows[row] |= bits
+        merged = []
+        growing = {}
+        for (y, bits) in enumerate(rows):
+            x = 0
+            below = {}
+            while bits:
+                # skip the untouched squares, then take the touched ones
+                skip = (bits & -bits).bit_length() - 1
+                bits >>= skip
+                x += skip
+                run = (~bits & (bits + 1)).bit_length() - 1
+                bits >>= run
+                rect = growing.pop((x, run), None)
+                if rect is not None and rect.bottom == top + y*cell:
+                    rect.height += cell
+                else:
+                    if rect is not None: merged.append(rect)
+                    rect = Rect(left + x*cell, top + y*cell, run*cell, cell)
+                below[(x, run)] = rect
+                x += run
+            merged.extend(growing.values())
+            growing = below
+        merged.extend(growing.values())
+        return [bounds.clip(rect) for rect in merged]
+    def take(self):
+        """ return the rectangles to update and start a new frame. The
+        merged area is left in lastarea. """
+        merged = self.merge()
+        self.rects = []
+        area = 0
+        for rect in merged:
+            area += rect.width*rect.height
+        if area > self.fullfraction * self.bounds.width * self.bounds.height:
+            merged = [self.bounds]
+            area = self.bounds.width * self.bounds.height
+        self.lastarea = area
+        return merged
+
+class _FrameTimes:
+    """ The times of the last few frames, in seconds, kept in a ring so
+    that adding a frame doesn't build a new list. The total and the number
+    of dropped frames are kept up to date as frames are added, so the
+    mean costs nothing to read.
+    """
+    def __init__(self, size=64):
+        self.size = size
+        self.clear()
+    def clear(self):
+        self.times = [0.0] * self.size
+        self.drops = [0] * self.size
+        self.next = 0
+        self.count = 0
+        self.total = 0.0
+        self.dropped = 0
+    def add(self, dt, dropped=0):
+        i = self.next
+        self.total += dt - self.times[i]
+        self.dropped += dropped - self.drops[i]
+        self.times[i] = dt
+        self.drops[i] = dropped
+        self.next = (i + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+        if self.next == 0:
+            # stop rounding errors building up in the running total
+            self.total = sum(self.times)
+    def mean(self):
+        return self.total / max(self.count, 1)
+    def sortedtimes(self):
+        """ return the frame times in order, quickest first. This sorts
+        the ring, so take it once and pass it to percentile. """
+        return sorted(self.times[:self.count])
+    def percentile(self, p, times=None):
+        """ return the frame time p percent of the frames were quicker
+        than. times is sortedtimes(), which is worked out if not given. """
+        if not self.count:
+            return 0.0
+        if times is None:
+            times = self.sortedtimes()
+        return times[min(int(p / 100.0 * self.count), self.count - 1)]
+
+class _Layer:
+    """ One of the drawing layers set up by addlayer. The screen itself
+    is the bottom layer. """
+    def __init__(self, name, surface, background, fill=(0,0,0,0), blend=0):
+        self.name = name
+        self.surface = surface
+        self.background = background
+        self.fill = fill
+        self.blend = blend
+        self.visible = 1
+        self.fgrects = {}
+
+class _SurfaceCache:
+    """ A least recently used cache of Surfaces, limited by the total
+    number of bytes of pixel data it holds. Counts hits and misses so
+    that the effect of the cache can be measured. """
+    def __init__(self, maxbytes):
+        self.maxbytes = maxbytes
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+    def get(self, key):
+        """ return the surface cached under key, or None """
+        surf = self.entries.get(key)
+        if surf is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return surf
+    def put(self, key, surf):
+        """ cache surf under key, evicting the least recently used
+        surfaces to stay within maxbytes """
+        size = surf.get_pitch() * surf.get_height()
+        if key in self.entries:
+            old = self.entries.pop(key)
+            self.bytes -= old.get_pitch() * old.get_height()
+        if size > self.maxbytes: return surf
+        self.entries[key] = surf
+        self.bytes += size
+        while self.bytes > self.maxbytes:
+            (k, old) = self.entries.popitem(last=False)
+            self.bytes -= old.get_pitch() * old.get_height()
+        return surf
+    def setlimit(self, maxbytes):
+        self.maxbytes = maxbytes
+        while self.bytes > self.maxbytes:
+            (k, old) = self.entries.popitem(last=False)
+            self.bytes -= old.get_pitch() * old.get_height()
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+    def stats(self):
+        return {'hits':self.hits, 'misses':self.misses,
+                'entries':len(self.entries), 'bytes':self.bytes,
+                'maxbytes':self.maxbytes}
+
+class _SurfacePool:
+    """ Spare Surfaces for short-lived drawing, kept by size so that a
+    surface that has been handed back can be handed out again instead of
+    making a new one. Surfaces without alpha have the pixel format of
+    format; surfaces with alpha are 32 bit. Limited by the total number
+    of bytes of pixel data in the spare surfaces, and counts hits and
+    misses like _SurfaceCache. """
+    def __init__(self, maxbytes, format=None):
+        self.maxbytes = maxbytes
+        self.format = format
+        self.spares = {}
+        self.bytes = 0
+        self.entries = 0
+        self.hits = 0
+        self.misses = 0
+    def setformat(self, format):
+        """ make surfaces like format from now on """
+        self.format = format
+        self.clear()
+    def _key(self, surf):
+        """ return the key surf is kept under, or None if it isn't one
+        of the kinds of surface handed out """
+        if surf.get_parent() is not None:
+            return None
+        alpha = surf.get_flags() & pygame.locals.SRCALPHA and 1 or 0
+        if alpha:
+            if surf.get_bitsize() != 32: return None
+        elif (surf.get_bitsize() != self.format.get_bitsize() or
+              surf.get_masks() != self.format.get_masks()):
+            return None
+        return (surf.get_size(), alpha)
+    def get(self, size, alpha=0):
+        """ return a surface of the given size. Its contents are left
+        over from whatever it was last used for. """
+        spares = self.spares.get((tuple(size), alpha and 1 or 0))
+        if spares:
+            surf = spares.pop()
+            self.bytes -= surf.get_pitch() * surf.get_height()
+            self.entries -= 1
+            self.hits += 1
+            return surf
+        self.misses += 1
+        if alpha:
+            return pygame.Surface(size, pygame.locals.SRCALPHA, 32)
+        return pygame.Surface(size, 0, self.format)
+    def put(self, surf):
+        """ keep surf to hand out again, if there is room for it """
+        key = self._key(surf)
+        if key is None: return
+        size = surf.get_pitch() * surf.get_height()
+        if self.bytes + size > self.maxbytes: return
+        self.spares.setdefault(key, []).append(surf)
+        self.bytes += size
+        self.entries += 1
+    def setlimit(self, maxbytes):
+        self.maxbytes = maxbytes
+        for spares in self.spares.values():
+            while spares and self.bytes > self.maxbytes:
+                surf = spares.pop()
+                self.bytes -= surf.get_pitch() * surf.get_height()
+                self.entries -= 1
+    def clear(self):
+        self.spares = {}
+        self.bytes = 0
+        self.entries = 0
+    def stats(self):
+        return {'hits':self.hits, 'misses':self.misses,
+                'entries':self.entries, 'bytes':self.bytes,
+                'maxbytes':self.maxbytes}
+
+# the pygame.draw functions _drawop draws once and copies, and the largest
+# area, in pixels, for which that is quicker; see bench_drawop.py
+_drawonce = {pygame.draw.aalines: 60000}
 
 class _ScreenModel:
     """
@@ -1691,34 +2038,133 @@ class _ScreenModel:
     >>> from easygame import *
     >>> # your easygame commands go here; a window appears for you automatically
     """
-    def __init__(self, surf=None):
+    def __init__(self, surf=None, headless=0):
+        self.headless = headless
+        self.keysdown = set()
+        if headless:
+            # nothing is ever shown, so don't depend on a real display
+            os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
         pygame.init()
-        modes = pygame.display.list_modes()
+        if not headless:
+            modes = pygame.display.list_modes()
         self.screen = None
+        self.window = None
+        self.fullupdatefraction = 0.5
+        self.frametimes = _FrameTimes()
+        self.pool = _SurfacePool(4*1024*1024) # scratch surfaces
+        self.jitter = 2
         if surf:
             self.setsurf(surf)
         else:
             self.setmode( (640,480) ) # calls self.setsurf
         self.batching = 0
+        self.autobatch = 0
+        self.lastpresent = 0
         self.fonttable = {}
         self.imagecache = {}
+        self.atlas = None
+        self.atlasrects = {}
         self.soundcache = None
-        self.tcache = None # caching of text rendering for onlysize of printat
-        self.scache = None # caching of surface for onlysize of superblit
+        self.tcache = _SurfaceCache(4*1024*1024) # rendered text for printat
+        self.scache = _SurfaceCache(16*1024*1024) # rotated and zoomed images for superblit
         self.sprites = []
         self.defaultcolour = Colour.white
         self.intouch = 0
+        self.framehooks = []
+        self.inframehooks = 0
         self.shutdown = False
     def _loadimage(self,filename):
         """ internal function to load an image and cache it """
         if filename in self.imagecache: return self.imagecache[filename]
+        if filename in self.atlasrects:
+            # share the pixels of the atlas rather than loading another copy
+            image = self.atlas.subsurface(self.atlasrects[filename])
+            self.imagecache[filename] = image
+            return image
         if not os.path.exists(filename):
             raise FileNotFound(filename)
         surf = pygame.image.load(filename)
         surf.set_colorkey(surf.get_at((0,0)), pygame.locals.RLEACCEL)
-        image = surf.convert()
+        image = self._convert(surf)
         self.imagecache[filename] = image
         return image
+    def loadanimation(self, filenames):
+        """ load the frames of an animation from filenames, in order, and
+        return them as a list of pygame Surfaces. The frames can be given to
+        plotimages, plotimage or superblit in place of a filename, so picking
+        and drawing a frame is only a list index and a blit. Frames that are
+        in the atlas (see buildatlas) share its pixels, so call buildatlas
+        first.
+        """
+        return [self._loadimage(filename) for filename in filenames]
+    def buildatlas(self, paths, width=1024):
+        """ pack images into a single surface (a texture atlas), so that
+        plotimage and plotimages draw them from one surface. This saves
+        memory and makes drawing lots of different images quicker.
+
+        paths is a list of image filenames and directories. Directories
+        are searched, including subdirectories, for .bmp, .png, .gif and
+        .jpg files, which are then known by their path with / separators,
+        for instance 'Sprites/Vims/Vim0.png'. Pass plotimage the filename
+        in that form to draw from the atlas. Rows of images are at most
+        width pixels wide.
+
+        Images are made transparent in the same way as plotimage does.
+        Calling buildatlas again replaces the previous atlas.
+        Returns the atlas surface.
+        """
+        filenames = []
+        for path in paths:
+            if os.path.isdir(path):
+                for (dirpath, dirnames, names) in os.walk(path):
+                    dirnames.sort()
+                    for name in sorted(names):
+                        if os.path.splitext(name)[1].lower() in ['.bmp', '.png', '.gif', '.jpg', '.jpeg']:
+                            filenames.append(os.path.join(dirpath, name).replace(os.sep, '/'))
+            else:
+                filenames.append(path)
+        images = []
+        for filename in filenames:
+            if not os.path.exists(filename):
+                raise FileNotFound(filename)
+            surf = pygame.image.load(filename)
+            surf.set_colorkey(surf.get_at((0,0)))
+            # a single atlas can't have a colour key per image, so use alpha
+            images.append((filename, self._convertalpha(self._convert(surf))))
+        # shelf packing; tallest first, in rows no wider than width
+        images.sort(key=lambda item: -item[1].get_height())
+        rects = {}
+        x, y, rowheight, atlaswidth = 0, 0, 0, 1
+        for (filename, surf) in images:
+            w, h = surf.get_size()
+            if x + w > width and x > 0:
+                x, y, rowheight = 0, y + rowheight, 0
+            rects[filename] = Rect((x, y), (w, h))
+            x += w
+            rowheight = max(rowheight, h)
+            atlaswidth = max(atlaswidth, x)
+        atlas = self._convertalpha(pygame.Surface((atlaswidth, max(y + rowheight, 1)), pygame.locals.SRCALPHA, 32))
+        for (filename, surf) in images:
+            atlas.blit(surf, rects[filename])
+        for filename in list(self.atlasrects) + list(rects):
+            self.imagecache.pop(filename, None)
+        self.atlas = atlas
+        self.atlasrects = rects
+        return atlas
+    def _convert(self, surf):
+        """ internal function to convert surf to the pixel format of the
+        display, whichever layer is being drawn on """
+        if self.headless:
+            return surf.convert(self.display)
+        return surf.convert()
+    def _convertalpha(self, surf):
+        """ internal function to convert surf to a per pixel alpha format.
+        Without a display pygame can't pick the format, so use 32 bit RGBA """
+        if not self.headless:
+            return surf.convert_alpha()
+        asurf = pygame.Surface(surf.get_size(), pygame.locals.SRCALPHA, 32)
+        asurf.blit(surf, (0,0))
+        return asurf
     def _loadsound(self,filename):
         """ internal function to load a sound file """
         import pygame.mixer
@@ -1738,8 +2184,10 @@ class _ScreenModel:
         """ reset the timing system. Should be called at the start
         of drawing a sequence of similar frames at a similar rate,
         so that the timing system can react. """
-        self.lttime = pygame.time.get_ticks()
-        self.tlist = []
+        self.lttime = time.perf_counter()
+        self.framestart = self.lttime
+        self.late = 0
+        self.frametimes.clear()
     def _colour(self,col):
         """Convert col to a tuple"""
         if col is None: return self.defaultcolour
@@ -1754,13 +2202,24 @@ class _ScreenModel:
         'purple', or 'orange', or many others.
         """
         self.defaultcolour = self._colour(col)
-    def setmode(self, size, fullscreen=0,depth=0, flags=0):
+    def setmode(self, size, fullscreen=0,depth=0, flags=0, windowsize=None, smooth=0):
         """ set screen mode to the given size.
         If argument fullscreen is set to true, display full screen. In that
         case size had better be a suitable video card resolution.
         If depth is set, try to get that number of bits per pixel.
         If flags is set, set those flags. See the documentation for pygame.display.set_mode
 
+        If windowsize is set, the window is that size instead, and the
+        screen, which is still size big, is scaled up to fit it. All the
+        drawing is done at size, so it costs the same however big the
+        window is. windowsize (0,0) means the size of the desktop, which
+        with fullscreen set is the whole monitor, whatever its resolution;
+        when running headless it means no scaling. Normally the screen is
+        scaled by a whole number, so pixels stay square and sharp, with a
+        black border round it if needed. If smooth is set, or the window
+        is smaller than the screen, it is scaled smoothly to fill as much
+        of the window as it can instead. Use windowtoscreen to convert mouse positions.
+
         Automatically sets the drawing clipping rectangle to the whole of the
         new screen area.
         """
@@ -1769,16 +2228,91 @@ class _ScreenModel:
             flags |= pygame.locals.FULLSCREEN
         if self.screen != None:
             pass
-        screen = pygame.display.set_mode(size, flags,depth)
+        window = None
+        if windowsize is not None and self.headless and tuple(windowsize) == (0,0):
+            # there is no desktop to fit, so don't scale at all
+            windowsize = None
+        if windowsize is not None and tuple(windowsize) != tuple(size):
+            window = self._makesurface(windowsize, flags, depth)
+            screen = pygame.Surface(size, 0, window)
+        else:
+            screen = self._makesurface(size, flags, depth)
         self.setsurf(screen)
+        if window is not None:
+            self._setwindow(window, smooth)
+    def _makesurface(self, size, flags, depth):
+        """ internal function to open the window for setmode """
+        if self.headless:
+            # draw into an offscreen surface instead of a window
+            if depth:
+                return pygame.Surface(size, 0, depth)
+            else:
+                return pygame.Surface(size, 0, 32)
+        return pygame.display.set_mode(size, flags,depth)
+    def _setwindow(self, window, smooth):
+        """ internal function to show the screen scaled up in window """
+        self.window = window
+        w, h = self.screenrect.size
+        ww, wh = window.get_size()
+        if not smooth and (ww < w or wh < h):
+            # too small to scale up by a whole number, so shrink it smoothly
+            smooth = 1
+        self.smooth = smooth
+        if smooth:
+            scale = min(float(ww)/w, float(wh)/h)
+        else:
+            scale = min(ww//w, wh//h)
+        self.windowrect = Rect(0, 0, int(w*scale), int(h*scale))
+        self.windowrect.center = window.get_rect().center
+        self.windowscale = scale
+        window.fill((0,0,0))
+        self.touchedrect(self.screenrect)
+    def _scaletowindow(self, rects):
+        """ internal function to scale rects of the screen into the window.
+        Returns the rects of the window that changed. """
+        if not rects:
+            return rects
+        wrect = self.windowrect
+        if self.smooth or rects[0] == self.screenrect:
+            # the scaled frame is kept in the window, and is only redone
+            # when something has been drawn
+            dest = self.window.subsurface(wrect)
+            if self.smooth:
+                pygame.transform.smoothscale(self.display, wrect.size, dest)
+            else:
+                pygame.transform.scale(self.display, wrect.size, dest)
+            return [wrect]
+        # a whole number scale, so each rect can be scaled on its own
+        scale = self.windowscale
+        wrects = []
+        for rect in rects:
+            wr = Rect(wrect.left + rect.left*scale, wrect.top + rect.top*scale,
+                      rect.width*scale, rect.height*scale)
+            pygame.transform.scale(self.display.subsurface(rect), wr.size,
+                                   self.window.subsurface(wr))
+            wrects.append(wr)
+        return wrects
+    def windowtoscreen(self, pos):
+        """ convert pos, a position in the window such as the mouse
+        position, to a position on the screen. This is only needed if the
+        screen is scaled to fit the window (see setmode). """
+        pos = Pos(pos)
+        if self.window is None:
+            return pos
+        wrect = self.windowrect
+        return Pos(int((pos[0] - wrect.left) / self.windowscale),
+                   int((pos[1] - wrect.top) / self.windowscale))
     def setsurf(self, surf):
-        """ set surf as the output surface """
+        """ set surf as the output surface. Any layers are removed. """
         size = surf.get_size()
-        self.screen = surf
+        self.display = surf
+        self.window = None
+        self.pool.setformat(surf)
         self.screenrect = Rect((0,0),size)
-        self.background = pygame.Surface(size, depth=surf.get_bitsize())
-        self.dirty = []
-        self.fgrects = {}
+        self.base = _Layer(None, surf, pygame.Surface(size, depth=surf.get_bitsize()))
+        self.layers = []
+        self._uselayer(self.base)
+        self.dirty = _DirtyRegion(self.screenrect, self.fullupdatefraction)
         self.resettime()
         self.cliprect = self.screenrect
     def setclipping(self, rect=None):
@@ -1791,14 +2325,107 @@ class _ScreenModel:
         else:
             self.cliprect = self.screenrect.clip(Rect(rect))
         return self.cliprect
+    def _uselayer(self, layer):
+        """ internal function to point the drawing operations at layer """
+        self.layer = layer
+        self.screen = layer.surface
+        self.background = layer.background
+        self.fgrects = layer.fgrects
+    def addlayer(self, name, blend=0, fill=None):
+        """ add a drawing layer called name, on top of any existing layers.
+
+        Layers let different kinds of drawing be kept apart, for instance
+        the floor of a game, the characters, and a score. Each layer keeps
+        its own surface, so drawing a layer never disturbs the ones below
+        it, and something drawn once on a layer stays there until it is
+        drawn over. Use setlayer() to choose which layer is drawn on.
+
+        Once there are layers, the normal screen becomes the bottom layer
+        and tick() builds the screen up from the layers, in order, but
+        only where something has been drawn.
+
+        Normally a layer is transparent where nothing has been drawn. If
+        blend is set to one of the pygame BLEND_ flags, such as
+        BLEND_RGB_SUB, the layer is opaque and is combined with the
+        layers below it using that flag instead. fill sets the colour the
+        layer starts as, and the colour clearscreen() clears it to.
+
+        Returns the new layer.
+        """
+        if self.getlayer(name) is not None:
+            raise BadArguments(name)
+        size = self.screenrect.size
+        if not self.layers:
+            # from now on the bottom layer is drawn offscreen, and tick()
+            # composites all the layers onto the display
+            self.base.surface = self.display.copy()
+            if self.layer is self.base:
+                self._uselayer(self.base)
+        if blend:
+            surf = pygame.Surface(size, 0, 32)
+            if fill is None: fill = (0,0,0)
+        else:
+            surf = pygame.Surface(size, pygame.locals.SRCALPHA, 32)
+            if fill is None: fill = (0,0,0,0)
+        surf.fill(fill)
+        # like the screen, each layer has a background holding what
+        # isn't temporary, so cleartemp can put it back
+        layer = _Layer(name, surf, surf.copy(), fill, blend)
+        self.layers.append(layer)
+        self.touchedrect(self.screenrect)
+        return layer
+    def getlayer(self, name):
+        """ return the layer called name, or None if there isn't one.
+        A layer's surface attribute is the pygame Surface it is drawn on. """
+        for layer in self.layers:
+            if layer.name == name:
+                return layer
+        return None
+    def setlayer(self, name=None):
+        """ draw on the layer called name from now on. If name is None
+        draw on the bottom layer, which is the normal screen. """
+        if name is None:
+            self._uselayer(self.base)
+            return
+        layer = self.getlayer(name)
+        if layer is None:
+            raise BadArguments(name)
+        self._uselayer(layer)
+    def showlayer(self, name, visible=1):
+        """ show the layer called name, or hide it if visible is false """
+        layer = self.getlayer(name)
+        if layer is None:
+            raise BadArguments(name)
+        layer.visible = visible
+        self.touchedrect(self.screenrect)
+    def removelayers(self):
+        """ remove all the layers, and go back to drawing straight onto the
+        screen. The screen keeps showing the layers until it is drawn over. """
+        if not self.layers: return
+        self.layers = []
+        self.base.surface = self.display
+        self._uselayer(self.base)
+    def _composite(self, rects):
+        """ internal function to build up rects of the display from the layers """
+        blits = []
+        base = self.base.surface
+        for rect in rects:
+            blits.append((base, rect.topleft, rect))
+            for layer in self.layers:
+                if layer.visible:
+                    blits.append((layer.surface, rect.topleft, rect, layer.blend))
+        self.display.blits(blits, doreturn=0)
     def getscreensurface(self):
         """ return the screen surface (not a copy). Make sure you call updaterect
-        if you modify the surface.
+        if you modify the surface. If a layer has been chosen with setlayer,
+        this is the surface of that layer.
         """
         return self.screen
     def getbackgroundsurface(self):
         """ return the background surface (not a copy). Make
         sure you call updaterect if you modify the surface.
+        If a layer has been chosen with setlayer, this is the background
+        of that layer.
         """
         return self.background
     def getscreensize(self):
@@ -1810,10 +2437,63 @@ class _ScreenModel:
     def getscreenheight(self):
         """ return the screen height. """
         return self.screenrect.height
+    def setfullupdate(self, fraction):
+        """ tick() normally merges the rectangles that have been drawn on
+        and updates just those. Once the merged area covers more than
+        fraction of the screen (default 0.5) it updates the whole screen
+        instead, which is quicker than many separate updates. Setting
+        fraction to 0 always updates the whole screen. """
+        self.fullupdatefraction = fraction
+        self.dirty.fullfraction = fraction
+    def getdirtyarea(self):
+        """ return the number of pixels updated by the last tick(), after
+        the drawn rectangles have been merged """
+        return self.dirty.lastarea
+    def _caches(self):
+        return {'rotozoom':self.scache, 'text':self.tcache, 'scratch':self.pool}
+    def getcachestats(self):
+        """ return a dictionary describing the caches easygame keeps. Each
+        entry is a dictionary of hits, misses, entries, bytes and maxbytes.
+        'rotozoom' is the cache of rotated and zoomed images, 'text' the
+        cache of text rendered by printat, and 'scratch' the spare surfaces
+        kept for getscratchsurface. """
+        stats = {}
+        for (name, cache) in self._caches().items():
+            stats[name] = cache.stats()
+        return stats
+    def setcachelimit(self, cache, maxbytes):
+        """ limit the cache named cache (see getcachestats) to maxbytes
+        bytes of pixel data. The least recently used surfaces are dropped
+        first. """
+        caches = self._caches()
+        if cache not in caches:
+            raise BadArguments(cache)
+        caches[cache].setlimit(maxbytes)
     def setbatching(self, batching):
         """ if batchingO is true, request that subsequent screen updates are not posted to
         the screen immediately, but instead wait for the next tick"""
         self.batching = batching
+    def setautobatching(self, milliseconds=16):
+        """ when batching is off, update the screen at most once every
+        milliseconds, rather than after every drawing command. Drawing
+        that hasn't been shown yet is shown when the keyboard is checked
+        (ispressed, getkey, waitforkeys), on pause, or on tick, so the
+        program still looks as though it draws immediately. The default of
+        16 milliseconds is about one refresh of the display. Set
+        milliseconds to 0 to update after every drawing command again.
+        """
+        self.autobatch = milliseconds
+    def _present(self):
+        """ internal function called when drawing is done while batching
+        is off, to put it on the screen now or, if autobatching, soon """
+        # frame hooks run inside tick, just before the screen is updated
+        if self.inframehooks: return
+        if self.autobatch and pygame.time.get_ticks() - self.lastpresent < self.autobatch: return
+        self.tick()
+    def _flush(self):
+        """ internal function to put any drawing that autobatching has
+        held back onto the screen """
+        if self.batching==0 and len(self.dirty): self.tick()
     def superblit(self, destpos, img, srcrect=None,temp=0,topleft=1,angle=0,zoom=1,onlysize=0,onlygetsurface=0, alpha=None):
         """ place img on to the screen at destpos. destpos specifies the
         middle of the image unless topleft is set to true.
@@ -1829,28 +2509,46 @@ class _ScreenModel:
         handles a bg/fg model, and can call tick automatically.
         """
         #print 'superblit',destpos,img,srcrect,temp,topleft,angle,zoom
+        if srcrect is None and angle == 0 and zoom == 1 and not (onlysize or onlygetsurface or alpha):
+            # the usual case: a whole image, as it is
+            if topleft:
+                destpos = (int(destpos[0]), int(destpos[1]))
+            else:
+                (w, h) = img.get_size()
+                destpos = (int(int(destpos[0]) - w/2), int(int(destpos[1]) - h/2))
+            if not temp:
+                self._clippedblit(self.background, img, destpos)
+            rect = self._clippedblit(self.screen, img, destpos)
+            self.touchedrect(rect, temp)
+            return rect
         destpos=  (int(destpos[0]), int(destpos[1]))
         if type(srcrect) == type(None):
             srcrect = img.get_rect()
         if (angle !=0 or zoom!=1):
-            oimg = img
-            if self.scache == (img,angle,zoom,srcrect):
-                img = self.scacheimg
+            key = (img,angle,zoom,tuple(srcrect))
+            cached = self.scache.get(key)
+            if cached is not None:
+                img = cached
                 srcrect = img.get_rect()
             else:
                 import pygame
+                tempsurf = None
                 if srcrect.size != img.get_size():
-                    tempsurf = pygame.Surface( (srcrect.width,srcrect.height) )
+                    tempsurf = self.pool.get(srcrect.size)
+                    tempsurf.fill((0,0,0))
                     tempsurf.blit(img,(0,0), srcrect)
                     img = tempsurf
                 import pygame.transform
-                img = img.convert_alpha()
+                img = self._convertalpha(img)
                 img = pygame.transform.rotozoom(img, angle,zoom)
-                self.scache = (oimg,angle,zoom,srcrect)
-                self.scacheimg = img
+                if tempsurf is not None:
+                    self.pool.put(tempsurf)
+                self.scache.put(key, img)
                 srcrect = img.get_rect()
         if not topleft:
-            destpos = (destpos[0] - (srcrect.width/2), destpos[1] - (srcrect.height/2))
+            # whole pixels, as in the fast path above; a half pixel here
+            # would let the clipping below leak a pixel
+            destpos = (int(destpos[0] - srcrect.width/2), int(destpos[1] - srcrect.height/2))
         origdestrect = Rect(destpos, srcrect.size)
         destrect = self.cliprect.clip(origdestrect)
         if destrect != origdestrect:
@@ -1868,6 +2566,18 @@ class _ScreenModel:
         rect = self.screen.blit(img, destpos, srcrect)
         self.touchedrect(rect, temp)
         return rect
+    def _clippedblit(self, surf, img, destpos):
+        """ internal function to blit img onto surf, leaving SDL to clip it
+        to the clipping rectangle. Returns the rectangle drawn on. """
+        cliprect = self.cliprect
+        # with no clipping rectangle set, SDL already clips to the surface
+        if cliprect is self.screenrect or cliprect.contains((destpos, img.get_size())):
+            return surf.blit(img, destpos)
+        oldclip = surf.get_clip()
+        surf.set_clip(cliprect)
+        rect = surf.blit(img, destpos)
+        surf.set_clip(oldclip)
+        return rect
     def touchedrect(self, rect, temp=0):
         """ Does the bookkeeping to reflect that the screen and/or background
         have been updated. 
@@ -1879,69 +2589,189 @@ class _ScreenModel:
         if self.intouch == 1: return
         self.intouch = 1
         assert isinstance(rect, Rect), rect
-        self.dirty.append(rect)
+        self.dirty.add(rect)
         if temp:
             if temp not in self.fgrects: self.fgrects[temp] = []
             self.fgrects[temp].append(rect)
-        if self.batching==0: self.tick()
         #self.line( rect.topleft, rect.bottomright, col='red', temp=1)
         #self.line( rect.topright, rect.bottomleft, col='red', temp=1)        
         self.intouch =0
+        if self.batching==0: self._present()
         return rect
+    def touchedrects(self, rects, temp=0):
+        """ Does the same bookkeeping as touchedrect for a list of
+        rectangles at once, calling tick at most once. Returns rects. """
+        if self.intouch == 1: return rects
+        self.dirty.addrects(rects)
+        if temp:
+            if temp not in self.fgrects: self.fgrects[temp] = []
+            self.fgrects[temp].extend(rects)
+        if self.batching==0: self._present()
+        return rects
+    def addframehook(self, hook):
+        """ register hook to be called by tick() once per frame, just before
+        the screen is updated. hook is called with no arguments and may draw
+        on the screen (normally with temp set), for instance to apply a post
+        processing pass such as lighting to the finished frame. Whatever it
+        draws is updated along with the rest of the frame, so the screen is
+        still only updated once per tick.
+        """
+        if hook not in self.framehooks:
+            self.framehooks.append(hook)
+    def delframehook(self, hook):
+        """ remove a hook registered with addframehook """
+        if hook in self.framehooks:
+            self.framehooks.remove(hook)
     def tick(self, fps=None, rough=1, quick=0):
         """ update the screen and timing system, and any sprites
 
         If fps is set, run at most that number of ticks per second.
-        If rough is not set or is set to true, use rough waiting when recovering. Normally true.
+        If rough is not set or is set to true, sleep until just before the
+        frame is due and then wait exactly (see setjitter). If rough is
+        false, wait exactly the whole time, which keeps the processor busy.
+
+        Returns the average time a frame has taken recently, in seconds.
+        See getframestats for more.
+
+        tick(fps) is the same as tick() followed by waitforframe(fps).
         """
         if self.shutdown:
             return
-        pygame.event.pump()
+        if not self.headless:
+            pygame.event.pump()
         # it shouldn't be necessary to exit at this point, but if we
         # are called from the idlefork socket thread and call
         # pygame.display.update, we get a problem inside pygame
         if quick: return
         
-        pygame.display.update(self.dirty)
-        self.dirty=[]
+        if self.framehooks:
+            self.inframehooks = 1
+            try:
+                for hook in list(self.framehooks):
+                    hook()
+            finally:
+                self.inframehooks = 0
+        rects = self.dirty.take()
+        if self.layers:
+            self._composite(rects)
+        if self.window is not None:
+            rects = self._scaletowindow(rects)
+        if not self.headless:
+            pygame.display.update(rects)
+        self.lastpresent = pygame.time.get_ticks()
         if quick: return
         if fps:
-            ftime = 1000.0/fps
-            t = pygame.time.get_ticks()
-            deltat = t - self.lttime
-            # fps debugging
-            #self.printat((100,100),fps,deltat,ftime,ftime-deltat,temp=1); pygame.display.update(self.dirty)
-            if ftime - deltat > 0.0:
-                self.pause(ftime - deltat,rough=rough)
-        t = pygame.time.get_ticks()
-        deltat = t - self.lttime        
-        self.lttime = t        
-        dt = deltat / 1000.0
-        self.tlist = self.tlist[-50:] + [dt]
-        tac = 0
-        for t in self.tlist:
-            tac += t
-        tav = tac/max(len(self.tlist),1)
-        return tav
+            self.waitforframe(fps, rough)
+        t = time.perf_counter()
+        dt = t - self.lttime
+        self.lttime = t
+        self.frametimes.add(dt, self.late)
+        self.late = 0
+        return self.frametimes.mean()
+    def waitforframe(self, fps, rough=1):
+        """ wait until it is time for the next frame, running at fps frames
+        per second; rough is as for tick. tick(fps) calls this after
+        updating the screen. Calling it separately, just before tick(),
+        lets the time spent waiting be told apart from the time spent
+        updating the screen.
+        """
+        deadline = self.framestart + 1.0/fps
+        self.late = time.perf_counter() > deadline + self.jitter/1000.0
+        self._waituntil(deadline, rough)
+        self.framestart = time.perf_counter()
+    def _waituntil(self, deadline, rough):
+        """ internal function for tick to wait until time.perf_counter()
+        reaches deadline. Sleeping can overrun by a few milliseconds, so
+        it stops sleeping jitter milliseconds early and spins the rest. """
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return
+        if rough:
+            sleep = int(remaining*1000 - self.jitter)
+            if sleep > 0:
+                self.pause(sleep, rough=1)
+        while time.perf_counter() < deadline:
+            pass
+    def setjitter(self, milliseconds=2):
+        """ set how many milliseconds before a frame is due tick(fps)
+        stops sleeping and starts waiting exactly. Sleeping can take a few
+        milliseconds longer than asked for, depending on the operating
+        system; a bigger value gives steadier frames but keeps the
+        processor busier. A frame that is ready more than this late counts
+        as dropped in getframestats. """
+        self.jitter = milliseconds
+    def getframestats(self):
+        """ return a dictionary describing how long the last 64 frames
+        took, for showing in a debug display. 'mean', 'p50', 'p95', 'p99'
+        and 'max' are frame times in milliseconds, 'pNN' being the time NN
+        percent of frames were quicker than. 'dropped' is how many frames
+        were late when tick was given an fps, and 'frames' is how many
+        frames there are figures for. The mean and dropped count are kept
+        up to date as frames go by; the percentiles cost one sort of the 64
+        frame times each call. """
+        ft = self.frametimes
+        # the percentiles all come from one sort of the 64 frame times
+        times = ft.sortedtimes()
+        return {'mean': ft.mean()*1000, 'p50': ft.percentile(50, times)*1000,
+                'p95': ft.percentile(95, times)*1000, 'p99': ft.percentile(99, times)*1000,
+                'max': ft.percentile(100, times)*1000, 'dropped': ft.dropped,
+                'frames': ft.count}
     def cleartemp(self,temp=None):
         """ remove temporary drawing. If temp is set, remove only
         temporary drawing done with temp set to the same value, otherwise
-        remove all temporary drawing. """
-        if temp==None:
-            ks = list(self.fgrects.keys())
-        else:
-            ks = []
-            if temp in self.fgrects:
-                ks = [temp]
-        for k in ks:
-            for rect in self.fgrects[k]:
-                self.superblit(rect.topleft, self.background, srcrect=rect,topleft=1)
-            self.fgrects[k] = []
+        remove all temporary drawing. Temporary drawing is removed from
+        every layer. """
+        touched = []
+        for layer in [self.base] + self.layers:
+            fgrects = layer.fgrects
+            if temp==None:
+                ks = list(fgrects.keys())
+            else:
+                ks = []
+                if temp in fgrects:
+                    ks = [temp]
+            rects = []
+            for k in ks:
+                rects.extend(fgrects[k])
+                fgrects[k] = []
+            if not rects: continue
+            overlapping = len(rects) > _DirtyRegion.maxrects
+            if overlapping:
+                # merging this many costs more than restoring the overlaps
+                # twice. Only the exact merge will do, as anything bigger
+                # would wipe out temporary drawing done with other temps
+                cliprect = self.cliprect
+                rects = [rect for rect in [cliprect.clip(rect) for rect in rects] if rect]
+            else:
+                rects = mergerects(rects, self.cliprect, exact=1)
+            # restore the background in one pass over the rectangles
+            background = layer.background
+            if layer.surface.get_flags() & pygame.locals.SRCALPHA:
+                # a plain blit would blend with the temporary drawing, so
+                # clear it and add the background on, which copies the alpha too
+                if overlapping:
+                    # an overlap mustn't be added on twice
+                    for rect in rects:
+                        layer.surface.fill((0,0,0,0), rect)
+                        layer.surface.blit(background, rect.topleft, rect, pygame.locals.BLEND_RGBA_ADD)
+                else:
+                    for rect in rects:
+                        layer.surface.fill((0,0,0,0), rect)
+                    layer.surface.blits([(background, rect.topleft, rect, pygame.locals.BLEND_RGBA_ADD) for rect in rects], doreturn=0)
+            else:
+                layer.surface.blits([(background, rect.topleft, rect) for rect in rects], doreturn=0)
+            touched.extend(rects)
+        if touched:
+            self.touchedrects(touched)
     def clearscreen(self, bg = (0,0,0), temp=0):
         """ clear the screen. bg can be used to specify the colour, which
-        defaults to black. If temp is true, make this drawing temporary."""
+        defaults to black. If temp is true, make this drawing temporary.
+        If a layer other than the bottom one is chosen (see setlayer), that
+        layer is cleared back to its fill colour instead."""
         self.cleartemp()
         if temp == 1: return
+        if self.layer is not self.base:
+            bg = self.layer.fill
         # use the fast fill to clear the background
         self.background.fill(bg, self.cliprect)
         self.screen.fill(bg,self.cliprect)
@@ -1949,7 +2779,8 @@ class _ScreenModel:
         return self.screenrect
     def plotimage(self, pos, filename, **kwargs):
         """ load image from filename, and place it onto the screen at pos
-        pos should be a 2-integer sequence.
+        pos should be a 2-integer sequence. filename can also be a pygame
+        Surface, such as one of the frames returned by loadanimation.
         Normally pos specifies the position of the middle of the image.
 
         topleft if set to true specifies pos refers to the topleft of the image rather than the center.
@@ -1960,8 +2791,58 @@ class _ScreenModel:
         zoom specifies the zoom factor
         alpha specifies the transparency (0=clear 255=opaque None=opaque)
         """
-        img = self._loadimage(filename)
+        if filename in self.atlasrects:
+            for k in kwargs:
+                if k not in ['temp', 'topleft', 'onlysize']: break
+            else:
+                return self.superblit(pos, self.atlas, srcrect=self.atlasrects[filename], **kwargs)
+        if isinstance(filename, pygame.Surface):
+            img = filename
+        else:
+            img = self._loadimage(filename)
         return self.superblit(*[pos,img], **kwargs)
+    def plotimages(self, items, temp=0, topleft=1):
+        """ place several images on the screen at once. items is a sequence
+        of (pos, image) pairs, where image is either a filename as for
+        plotimage or a pygame Surface.
+
+        This is much quicker than calling plotimage for each image, as
+        all the images are drawn by a single blit and the bookkeeping is
+        done once. It does not support rotation, zoom or alpha; use
+        plotimage for those.
+
+        topleft and temp work as for plotimage, and apply to every image.
+        Returns a list of the bounding rectangles of the images.
+        """
+        blits = []
+        atlas, atlasrects = self.atlas, self.atlasrects
+        for (pos, img) in items:
+            if isinstance(img, pygame.Surface):
+                area = None
+            elif img in atlasrects:
+                area = atlasrects[img]
+                img = atlas
+            else:
+                img = self._loadimage(img)
+                area = None
+            if area is None:
+                w, h = img.get_size()
+            else:
+                w, h = area.size
+            if topleft:
+                blits.append((img, (int(pos[0]), int(pos[1])), area))
+            else:
+                blits.append((img, (int(pos[0] - w/2), int(pos[1] - h/2)), area))
+        if not blits: return []
+        surfs = [self.screen]
+        if not temp: surfs.append(self.background)
+        for surf in surfs:
+            # let SDL do the clipping rather than clipping each image here
+            oldclip = surf.get_clip()
+            surf.set_clip(self.cliprect)
+            rects = surf.blits(blits)
+            surf.set_clip(oldclip)
+        return self.touchedrects(rects, temp)
     def printat(self, pos, *args, **kwargs):
         """ place some text on the screen at pos. Interprets (non keyword)
         arguments like print does; i.e. converts them to strings if necessary
@@ -2025,18 +2906,18 @@ class _ScreenModel:
             pointsize = min(size[1], size[0] / len(text)) 
         iterations = 0
         while True:        
-            tdes=  (text,font,pointsize,fg,bg)
             pointsize = int(pointsize)
-            if self.tcache == tdes:
-                tsurf = self.tcachesurf
-            else:
+            tdes=  (text,font,pointsize,fg,bg)
+            tsurf = self.tcache.get(tdes)
+            if tsurf is None:
                 if (font, pointsize) not in self.fonttable:
                     self.fonttable[ (font, pointsize) ] = pygame.font.SysFont(font, pointsize)
-                font = self.fonttable[ (font, pointsize) ]
+                fontobj = self.fonttable[ (font, pointsize) ]
                 if bg == None:
-                    tsurf = font.render(text, 1, fg)
+                    tsurf = fontobj.render(text, 1, fg)
                 else:
-                    tsurf = font.render(text, 1, fg, bg)
+                    tsurf = fontobj.render(text, 1, fg, bg)
+                self.tcache.put(tdes, tsurf)
             if size is None:
                 break    
             print(pointsize, tsurf.get_rect().width, tsurf.get_rect().height, size)
@@ -2054,21 +2935,48 @@ class _ScreenModel:
                 pointsize /= ratio*1.1
                 
             
-        self.tcache = tdes
-        self.tcachesurf = tsurf
         return self.superblit(pos,tsurf,temp=temp,topleft=topleft,
                               onlysize=onlysize,
                               onlygetsurface=onlygetsurface,
                               angle=angle,zoom=zoom, alpha=alpha)
     def _drawop(self, op, *args, **kwargs):
+        """ internal function to draw with op, one of the pygame.draw
+        functions, on the screen and, unless temp is set, the background.
+
+        Shapes that are slow to draw but small, according to _drawonce,
+        are drawn on the background only and their rectangle copied to
+        the screen. Anything else is drawn on both, because SDL draws it
+        about as quickly as it copies its rectangle, or quicker. """
         args = list(args)
-        rect = op(*[self.screen]+args)
         temp = 0
         if 'temp' in kwargs: temp = kwargs['temp']
-        if 'rect' in kwargs: rect = kwargs['rect']
-        if not temp:
-            op(*[self.background]+args)            
+        surfs = [self.screen]
+        if not temp: surfs = [self.background, self.screen]
+        for surf in surfs:
+            # SDL clips the drawing to the clipping rectangle for us
+            oldclip = surf.get_clip()
+            surf.set_clip(self.cliprect)
+            drawn = op(*[surf]+args)
+            surf.set_clip(oldclip)
+            if surf is self.background and self._copyable(op, drawn):
+                self.screen.blit(self.background, drawn.topleft, drawn)
+                break
+        rect = drawn
+        if 'rect' in kwargs: rect = self.cliprect.clip(kwargs['rect'])
         return  self.touchedrect(rect,temp=temp)
+    def _copyable(self, op, rect):
+        """ internal function for _drawop, deciding whether the shape
+        just drawn on the background in rect can be copied to the screen """
+        if rect.width * rect.height > _drawonce.get(op, 0):
+            return 0
+        if self.screen.get_flags() & pygame.locals.SRCALPHA:
+            # a blit would blend rather than copy
+            return 0
+        # the copy would wipe out temporary drawing under the shape
+        for rects in self.fgrects.values():
+            if rects and rect.collidelist(rects) != -1:
+                return 0
+        return 1
     def circle(self, pos, radius, col=None, width=0, temp=0,angle=0,zoom=1):
         """ draw a circle centred at pos and of the given radius
         If width is zero or unspecified, draw a solid circle
@@ -2087,13 +2995,11 @@ class _ScreenModel:
         col = self._colour(col)
         r = int(radius)
         if r < radius: r+=1
-        cr = self.cliprect
-        if pos[0] - r < cr.left or pos[0] + r > cr.right or pos[1] - r < cr.top or pos[1] + r > cr.bottom:
-            return ellipse(Rect(pos[0]-r, pos[1]-r, 2*r, 2*r), col=col,width=width,temp=temp)
-        else:
-            return self._drawop(pygame.draw.circle,
-                         col,Pos(pos).tointeger(),r-1,width,
-                         temp=temp,rect=Rect((int(pos[0]-r),int(pos[1]-r)),(r*2,r*2)))
+        rect = Rect((int(pos[0]-r),int(pos[1]-r)),(r*2,r*2))
+        if not self.cliprect.colliderect(rect): return Rect(0,0,0,0)
+        return self._drawop(pygame.draw.circle,
+                     col,Pos(pos).tointeger(),r-1,width,
+                     temp=temp,rect=rect)
     def arc(self, pos0, pos1, x, col=None, width=1, debug=0, steps=None,
             temp=0):
         """
@@ -2167,11 +3073,11 @@ class _ScreenModel:
         pos = rect.center
         colrect = self.cliprect.clip(rect)
         if colrect.width == 0 or colrect.height == 0: return Rect(0,0,0,0)
-        if colrect == rect and angle==0:
+        if angle==0:
             return self._drawop(pygame.draw.ellipse,
                                  col,rect,width, temp=temp)
         else:
-            # ellipse only partially out, or rotated
+            # pygame can't rotate an ellipse, so draw a rotated polygon
             sides = 4 + ( rect.width + rect.height)//4
             theta = 0
             thetainc = math.pi * 2 / sides
@@ -2180,7 +3086,6 @@ class _ScreenModel:
                 pts.append ( (pos[0]+(rect.width/2.0)*math.sin(theta),
                               pos[1]+(rect.height/2.0)*math.cos(theta)) )
                 theta += thetainc
-            # let the polygon do the clipping (could be improved)
             return self.polygon( pts, col=col, width=width,
                                  temp=temp, angle=angle)
 
@@ -2206,7 +3111,7 @@ class _ScreenModel:
             return Rect( 0,0,0,0)
         return self._drawop(pygame.draw.line,
                      col,pos0,pos1,width,temp=temp)
-    def lines(self,positions,col=None,width=1,temp=0,angle=0,zoom=1):
+    def lines(self,positions,col=None,width=1,temp=0,angle=0,zoom=1,antialias=0):
         """
         Draw an open sequence of lines through ``positions``,
         ``width`` defaults to 1, ``colour`` to white.
@@ -2215,29 +3120,23 @@ class _ScreenModel:
         ``zoom`` specifies the zoom factor
         (``angle`` and ``zoom`` operate around the arithmetic
         centroid of the lines)        
+        If ``antialias`` is true, draw smooth lines one pixel wide
+        (``width`` is ignored).
 
         Returns the bounding rectangle of the lines.        
         """
         col = self._colour(col)
+        if len(positions) < 2:
+            return Rect(0,0,0,0)
         if angle != 0 or zoom != 1:
             positions = rotozoompositions(positions,angle,zoom)
-        # use a simple algorithm; i.e. just pass out to line()
-        # I think it is possible to do better by unwinding the line()
-        # algorithm here, but that's going to be complex
-        pairs = []
-        posbeta = None
-        ur = None
-        first = 1
-        for pos in positions:
-            if posbeta!=None:
-                r = self.line(posbeta,pos,col=col,width=width,temp=temp)
-                if first:
-                    ur = r
-                    first = 0
-                else:
-                    ur = ur.union(r)
-            posbeta = pos
-        return ur
+        return self._polyline(positions, col, width, temp, 0, antialias)
+    def _polyline(self, positions, col, width, temp, closed, antialias=0):
+        """ internal function to draw all the lines through positions
+        with a single pygame call, leaving the clipping to SDL """
+        if antialias:
+            return self._drawop(pygame.draw.aalines,col,closed,positions,temp=temp)
+        return self._drawop(pygame.draw.lines,col,closed,positions,width,temp=temp)
     def polygon(self,positions,col=None,width=0,temp=0,angle=0,zoom=1):
         """
         Draw a polygon with vertices at positions, width defaults to
@@ -2254,16 +3153,18 @@ class _ScreenModel:
         if angle!=0 or zoom!=1:
             positions = rotozoompositions(positions,angle,zoom)
         if width != 0:
-            self.lines( positions+[positions[0]], col, width,temp)
+            return self._polyline(positions, col, width, temp, 1)
         else:
             # zero width
-            positions = clippoly(positions, self.cliprect)
-            if positions == []:
-                return Rect(0,0,0,0)
             if len(positions) <= 2:
                 return line(positions[0], positions[-1], width=width,col=col,temp=temp)
-            else:
-                return self._drawop(pygame.draw.polygon,col,positions,width,temp=temp)
+            xs = [pos[0] for pos in positions]
+            ys = [pos[1] for pos in positions]
+            bounds = Rect(int(min(xs)), int(min(ys)), int(max(xs)-min(xs))+1, int(max(ys)-min(ys))+1)
+            if not self.cliprect.colliderect(bounds):
+                return Rect(0,0,0,0)
+            # SDL does the clipping, which is much quicker than clippoly()
+            return self._drawop(pygame.draw.polygon,col,positions,width,temp=temp)
     def rectangle(self,rect,rectb=None,col=None,width=0,temp=0,angle=0,zoom=1):
         """ draw a rectangle size rect.
         If width is zero or unspeciifed, draw a solid rectangle otherwise
@@ -2307,6 +3208,12 @@ class _ScreenModel:
         the argument block as false.        
         """        
         if dotick: self.tick()
+        if self.headless:
+            # no keyboard; answer as though the first key asked for was pressed
+            for k in self.keysdown:
+                if not keycodes or k in keycodes: return k
+            if keycodes: return keycodes[0]
+            return None
         while 1:
             if block:
                 ev = pygame.event.wait()
@@ -2330,11 +3237,11 @@ class _ScreenModel:
 
         Note that in this case temp is a flag; any true value will reveal
         drawing on all temporary layers.
+
+        To read a lot of pixels, call lockscreen first, or use getpixels
+        or getarray instead.
         """
-        if not temp:
-            s=self.background
-        else:
-            s=self.screen
+        s = self._viewsurface(temp)
         if not self.screenrect.collidepoint(pos[0],pos[1]):
             return None
         return s.get_at(pos)
@@ -2349,7 +3256,11 @@ class _ScreenModel:
         drawing on all temporary layers.
 
         Note that getarea returns a copy of the pixel data; changing
-        the returned surface will not update the screen.
+        the returned surface will not update the screen. Use getview,
+        getpixels or getarray to look at the screen without copying it.
+        If you call getarea often, hand the surface back with
+        releasesurface when you have finished with it, so that it can be
+        reused.
         """
         if type(rect) == type(None) and rect == None:
             rect = self.cliprect
@@ -2358,15 +3269,91 @@ class _ScreenModel:
         else:
             s=self.screen
         rect = self.cliprect.clip(Rect(rect))
-        dest = pygame.Surface(rect.size)
+        dest = self.pool.get(rect.size)
+        if s.get_flags() & pygame.locals.SRCALPHA:
+            # a layer; like a new surface, the copy starts out black
+            dest.fill((0,0,0))
         dest.blit(s, (0,0), rect)
         return dest
+    def getscratchsurface(self, size, alpha=0):
+        """ return a surface of the given size to draw on for a short
+        time, with per pixel alpha if alpha is set. What it contains is
+        left over from the last time it was used, so fill it first. When
+        you have finished with it give it back with releasesurface, and
+        the next call for a surface of that size can have it instead of
+        making a new one.
+        """
+        return self.pool.get(size, alpha)
+    def releasesurface(self, surf):
+        """ hand back a surface from getscratchsurface or getarea that you
+        have finished with. Don't use it again afterwards. Up to 4Mb of
+        spare surfaces are kept (see setcachelimit). """
+        self.pool.put(surf)
+    def _viewsurface(self, temp):
+        """ internal function returning the surface getat and the views read """
+        if not temp:
+            return self.background
+        return self.screen
+    def getview(self, rect=None, temp=0):
+        """ return a pygame Surface that is a view onto an area of the
+        screen (or background if temp is false), like getarea but without
+        copying anything. The area is the clipping area if rect isn't given.
+
+        The view shares its pixels with the screen, so it always shows
+        what is there now, and changing it changes the screen (call
+        updaterect afterwards). It stops being a view if the screen mode
+        changes or a layer is added.
+        """
+        if type(rect) == type(None) and rect == None:
+            rect = self.cliprect
+        rect = self.cliprect.clip(Rect(rect))
+        return self._viewsurface(temp).subsurface(rect)
+    def getpixels(self, rect=None, temp=0):
+        """ return a pygame PixelArray over an area of the screen (or
+        background if temp is false), without copying it. Indexing it as
+        pixels[x][y] reads or writes the pixel at (x,y) of the area, as a
+        mapped colour; see the pygame documentation for PixelArray.
+
+        The screen stays locked, and so can't be drawn on, until the
+        PixelArray is closed. Use it in a with statement, or call its
+        close method when you've finished::
+
+            with getpixels() as pixels:
+                red = pixels[10][10] == getscreensurface().map_rgb(Colour.red)
+        """
+        return pygame.PixelArray(self.getview(rect, temp))
+    def getarray(self, rect=None, temp=0, raw=0):
+        """ return a numpy array over an area of the screen (or background
+        if temp is false), without copying it. array[x][y] is the (R,G,B)
+        of the pixel at (x,y) of the area. If raw is set, array[x][y] is the
+        pixel as one mapped integer instead, which is quicker and is handy
+        for comparing or hashing frames. Needs numpy.
+
+        The screen stays locked, and so can't be drawn on, until the array
+        is deleted (del array).
+        """
+        import pygame.surfarray
+        view = self.getview(rect, temp)
+        if raw:
+            return pygame.surfarray.pixels2d(view)
+        return pygame.surfarray.pixels3d(view)
+    def lockscreen(self, temp=0):
+        """ lock the screen (or background if temp is false) so that a lot
+        of getat calls in a row don't each lock and unlock it. Nothing can
+        be drawn until unlockscreen is called with the same temp.
+        """
+        self._viewsurface(temp).lock()
+    def unlockscreen(self, temp=0):
+        """ undo lockscreen """
+        self._viewsurface(temp).unlock()
     def waitforkeys(self, keycodes=None, dotick=1):
         """ wait for all the keys in keycodes to be released, and then
         wait for one of them to be pressed. Return the one that was
         pressed """
         if keycodes != None and type(keycodes) != type([]): keycodes = [keycodes]
         if dotick: self.tick()
+        if self.headless:
+            return self.getkey(keycodes, block=1, dotick=0)
         while keycodes != None:
             pressed = pygame.key.get_pressed()
             any = 0
@@ -2399,8 +3386,25 @@ class _ScreenModel:
     def ispressed(self, keycode):
         """ check if the specified key is currently pressed, without blocking
         """
+        self._flush()
+        if self.headless:
+            return keycode in self.keysdown
         import pygame.key
         return pygame.key.get_pressed()[keycode]
+    def setkeysdown(self, keycodes=()):
+        """ when running headless (see isheadless) there is no keyboard, so
+        set which keys ispressed reports as held down. getkey and
+        waitforkeys return one of these keys if they can, otherwise the
+        first key they were asked to wait for.
+        """
+        self.keysdown = set(keycodes)
+    def isheadless(self):
+        """ return true if easygame is drawing to an offscreen surface
+        without a display. Set sys.easygameheadless = 1, or the environment
+        variable EASYGAME_HEADLESS=1, before importing easygame to run
+        headless. sys.pygamesurf can still be used to supply the surface.
+        """
+        return self.headless
     def pause(self,milliseconds,rough=0):
         """ pause the program for the specified number of milliseconds.
         Unfortunately the program will still do work in the time you have
@@ -2411,6 +3415,7 @@ class _ScreenModel:
 
         Returns the number of milliseconds the pause actually took.
         """
+        self._flush()
         import pygame.time
         milliseconds = int(milliseconds)
         if rough:
@@ -3186,7 +4191,8 @@ else:
         surf = None
         if hasattr(sys, 'pygamesurf'):
             surf = getattr(sys, 'pygamesurf')
-        _obj = _ScreenModel(surf=surf)
+        headless = getattr(sys, 'easygameheadless', 0) or os.environ.get('EASYGAME_HEADLESS', '') not in ['', '0']
+        _obj = _ScreenModel(surf=surf, headless=headless)
         for cmd in dir(_ScreenModel):
             if cmd[0] != '_':
                 try: